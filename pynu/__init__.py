@@ -25,8 +25,9 @@ LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from graph import GraphNode
-from tree import TreeNode
+from graph import GraphNode, ReachabilityIndex, WeakGraphNode
+from pattern import Pattern
+from tree import TreeNode, WeakTreeNode, diff
 
 __author__ = 'Juho Vepsäläinen'
 __version__ = '0.1.4'
@@ -25,8 +25,370 @@ LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from node import Node
+import collections
+import random
+import weakref
+
+from node import Node, WeakNodeContainer, WeakOwnerContainer
+
+
+def _connected_nodes(roots):
+    """Returns the nodes connected to the given ones in either direction in
+    breadth-first order."""
+    nodes = list()
+    seen = set()
+    pending = collections.deque()
+
+    def enqueue(node):
+        if node not in seen:
+            seen.add(node)
+            pending.append(node)
+
+    for root in roots:
+        enqueue(root)
+
+    while pending:
+        node = pending.popleft()
+        nodes.append(node)
+
+        for neighbour in getattr(node, node._children_name):
+            enqueue(neighbour)
+
+        for neighbour in getattr(node, node._parents_name):
+            enqueue(neighbour)
+
+    return nodes
 
 
 class GraphNode(Node):
     pass
+
+
+class WeakGraphNode(GraphNode):
+    """GraphNode that refers to its parents weakly. Links between nodes do
+    not form reference cycles unless the children links do so themselves.
+
+    >>> node1, node2 = WeakGraphNode(), WeakGraphNode()
+    >>> node1.children = node2
+    >>>
+    >>> assert node2.parents == [node1, ]
+    >>>
+    >>> del node1
+    >>> assert node2.parents == None
+    """
+    _children_container = WeakOwnerContainer
+    _parents_container = WeakNodeContainer
+
+
+class ReachabilityIndex(object):
+    """Answers "can node A reach node B?" questions for the graphs the given
+    nodes belong to. The graph is condensed to its strongly connected
+    components which are labeled with intervals (GRAIL). If component B is
+    reachable from component A, the intervals of B are contained within the
+    ones of A in every labeling. In addition B is reachable in case it lies
+    below A in the traversal tree of a labeling. Most queries are answered by
+    the labels alone. The rest are answered by a search that skips the
+    components whose intervals do not contain the ones of the target. The
+    index takes linear space and is rebuilt lazily in linear time on the
+    next query after the graph has been modified through the node
+    containers.
+
+    Note that the index refers to the indexed nodes strongly. It keeps the
+    nodes of WeakGraphNode graphs alive until the index itself is dropped.
+
+    Regular case
+
+    >>> node1, node2, node3, node4 = GraphNode(), GraphNode(), GraphNode(), \\
+    ...     GraphNode()
+    >>>
+    >>> node1.children = (node2, node3)
+    >>> node3.children = node4
+    >>>
+    >>> index = ReachabilityIndex(node1)
+    >>>
+    >>> assert index.reaches(node1, node4)
+    >>> assert index.reaches(node3, node4)
+    >>> assert not index.reaches(node4, node1)
+    >>> assert not index.reaches(node2, node4)
+
+    A node reaches itself only through a cycle, just like in find
+
+    >>> assert not index.reaches(node1, node1)
+
+    Cyclic case
+
+    >>> node4.children.append(node1)
+    >>>
+    >>> assert index.reaches(node4, node2)
+    >>> assert index.reaches(node1, node1)
+    >>> assert not index.reaches(node2, node2)
+
+    Nodes outside of the graph are not reachable
+
+    >>> assert not index.reaches(node1, GraphNode())
+
+    Multiple pairs at once
+
+    >>> node4.children.remove(node1)
+    >>>
+    >>> assert index.reaches_all([(node1, node4), (node4, node1)]) == \\
+    ...     [True, False]
+
+    References of dropped indexes are cleaned up
+
+    >>> for i in range(3):
+    ...     assert ReachabilityIndex(node1).reaches(node1, node4)
+    >>>
+    >>> assert len(node1._observers) == 2
+    """
+
+    _labelings = 2
+
+    def __init__(self, *nodes):
+        super(ReachabilityIndex, self).__init__()
+
+        self._roots = nodes
+        self._ref = weakref.ref(self)
+        self._dirty = True
+        self._components = dict()
+        self._successors = list()
+        self._cyclic = list()
+        self._intervals = list()
+
+    def invalidate(self):
+        """Marks the index to be rebuilt on the next query."""
+        self._dirty = True
+
+    def reaches(self, source, target):
+        """Checks if target can be reached from source by following
+        children."""
+        self._update()
+
+        return self._reaches(source, target)
+
+    def reaches_all(self, pairs):
+        """Checks reachability for each (source, target) pair given. Returns
+        a list of booleans."""
+        self._update()
+
+        return [self._reaches(source, target) for source, target in pairs]
+
+    def _reaches(self, source, target):
+        try:
+            source_component = self._components[source]
+            target_component = self._components[target]
+        except KeyError:
+            return False
+
+        if source_component == target_component:
+            return self._cyclic[source_component]
+
+        if not self._contains(source_component, target_component):
+            return False
+
+        if self._descends(source_component, target_component):
+            return True
+
+        successors = self._successors
+        visited = set([source_component])
+        pending = [source_component]
+
+        while pending:
+            for component in successors[pending.pop()]:
+                if component in visited or \
+                        not self._contains(component, target_component):
+                    continue
+
+                if self._descends(component, target_component):
+                    return True
+
+                visited.add(component)
+                pending.append(component)
+
+        return False
+
+    def _contains(self, component, other):
+        """Checks if the intervals of component contain the ones of other.
+        Otherwise other cannot be reached from component."""
+        for lows, ranks, starts in self._intervals:
+            if lows[other] < lows[component] or \
+                    ranks[other] > ranks[component]:
+                return False
+
+        return True
+
+    def _descends(self, component, other):
+        """Checks if other is below component in a traversal tree. In that
+        case other can be reached from component."""
+        for lows, ranks, starts in self._intervals:
+            if starts[component] <= ranks[other] <= ranks[component]:
+                return True
+
+        return False
+
+    def _update(self):
+        if self._dirty:
+            self._build(self._collect_nodes())
+            self._dirty = False
+
+    def _collect_nodes(self):
+        """Collects the nodes connected to the roots and starts observing them
+        for changes."""
+        nodes = _connected_nodes(self._roots)
+
+        for node in nodes:
+            self._observe(node)
+
+        return nodes
+
+    def _observe(self, node):
+        # a single weak reference is shared by all the nodes observed
+        observers = getattr(node, '_observers', None)
+
+        if observers is None:
+            node._observers = [self._ref, ]
+            return
+
+        observers[:] = [ref for ref in observers if ref() is not None]
+
+        if self._ref not in observers:
+            observers.append(self._ref)
+
+    def _build(self, nodes):
+        """Finds strongly connected components using an iterative version of
+        Tarjan's algorithm and labels the resulting graph of components.
+        Components are completed in reverse topological order so their
+        successors are known by the time they are completed."""
+        components = dict()
+        successors = list()
+        cycles = list()
+        indices = dict()
+        lowlinks = dict()
+        stack = list()
+        on_stack = set()
+
+        def children(node):
+            return iter(getattr(node, node._children_name))
+
+        def visit(node):
+            indices[node] = lowlinks[node] = len(indices)
+            stack.append(node)
+            on_stack.add(node)
+            work.append((node, children(node)))
+
+        for root in nodes:
+            if root in indices:
+                continue
+
+            work = list()
+            visit(root)
+
+            while work:
+                node, remaining_children = work[-1]
+
+                for child in remaining_children:
+                    if child not in indices:
+                        visit(child)
+                        break
+                    elif child in on_stack:
+                        lowlinks[node] = min(lowlinks[node],
+                            indices[child])
+                else:
+                    work.pop()
+
+                    if work:
+                        parent = work[-1][0]
+                        lowlinks[parent] = min(lowlinks[parent],
+                            lowlinks[node])
+
+                    if lowlinks[node] == indices[node]:
+                        members = list()
+
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            members.append(member)
+
+                            if member is node:
+                                break
+
+                        component = len(successors)
+                        for member in members:
+                            components[member] = component
+
+                        component_successors = set()
+                        cyclic = len(members) > 1
+                        for member in members:
+                            member_children = getattr(member,
+                                member._children_name)
+
+                            for child in member_children:
+                                child_component = components[child]
+
+                                if child_component == component:
+                                    cyclic = True
+                                else:
+                                    component_successors.add(child_component)
+
+                        successors.append(tuple(component_successors))
+                        cycles.append(cyclic)
+
+        self._components = components
+        self._successors = successors
+        self._cyclic = cycles
+        self._intervals = [_interval_labels(successors, random.Random(i))
+            for i in range(self._labelings)]
+
+
+def _interval_labels(successors, randomizer):
+    """Labels the components of an acyclic graph by traversing it depth-first.
+    The traversals start from the components in topological order and visit
+    successors in random order. Each component gets its postorder rank, the
+    lowest rank among the components reachable from it and the lowest rank
+    among its descendants in the traversal tree. Components are given in
+    reverse topological order. Returns the lists of lowest ranks, ranks and
+    lowest tree ranks."""
+    count = len(successors)
+    lows = [0] * count
+    ranks = [0] * count
+    starts = [0] * count
+    visited = [False] * count
+    rank = 0
+
+    def enter(component):
+        visited[component] = True
+        starts[component] = rank
+        component_successors = successors[component]
+
+        if len(component_successors) > 1:
+            component_successors = list(component_successors)
+            randomizer.shuffle(component_successors)
+
+        pending.append((component, iter(component_successors)))
+
+    for root in range(count - 1, -1, -1):
+        if visited[root]:
+            continue
+
+        pending = list()
+        enter(root)
+
+        while pending:
+            component, remaining = pending[-1]
+
+            for successor in remaining:
+                if not visited[successor]:
+                    enter(successor)
+                    break
+            else:
+                pending.pop()
+
+                low = rank
+                for successor in successors[component]:
+                    low = min(low, lows[successor])
+
+                lows[component] = low
+                ranks[component] = rank
+                rank += 1
+
+    return lows, ranks, starts
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse matrix utilities. Requires NumPy and SciPy.
+"""
+"""
+Pynu - Python Node Utilities
+Copyright (c) 2014 Juho Vepsäläinen
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import numbers
+
+import numpy
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from graph import GraphNode, _connected_nodes
+
+
+def to_matrix(*nodes):
+    """Exports the graphs the given nodes belong to as a sparse adjacency
+    matrix. Row i has a nonzero at column j in case the j:th node is a child
+    of the i:th one. Returns the matrix in CSR format and the list of nodes
+    mapping matrix indices to nodes. The nodes are listed in breadth-first
+    order beginning from the given ones.
+
+    >>> node1, node2, node3 = GraphNode(), GraphNode(), GraphNode()
+    >>> node1.children = (node2, node3)
+    >>> node3.children = node1
+    >>>
+    >>> matrix, nodes = to_matrix(node1)
+    >>>
+    >>> assert nodes == [node1, node2, node3]
+    >>> assert matrix.toarray().tolist() == [[0, 1, 1], [0, 0, 0], [1, 0, 0]]
+    """
+    nodes = _connected_nodes(nodes)
+    indices = dict((node, i) for i, node in enumerate(nodes))
+
+    rows = list()
+    columns = list()
+    for i, node in enumerate(nodes):
+        for child in getattr(node, node._children_name):
+            rows.append(i)
+            columns.append(indices[child])
+
+    matrix = sparse.csr_matrix(
+        (numpy.ones(len(rows), dtype=numpy.int8), (rows, columns)),
+        shape=(len(nodes), len(nodes)))
+
+    return matrix, nodes
+
+
+def from_matrix(matrix, nodes=None, node_class=GraphNode):
+    """Imports links from a sparse adjacency matrix. The links are added to
+    the given nodes. In case no nodes are given, new ones are created using
+    node_class. Returns the nodes.
+
+    >>> matrix = sparse.csr_matrix([[0, 1, 1], [0, 0, 0], [1, 0, 0]])
+    >>> node1, node2, node3 = from_matrix(matrix)
+    >>>
+    >>> assert node1.children == [node2, node3]
+    >>> assert node3.children == [node1, ]
+    >>> assert node1.parents == [node3, ]
+
+    Round trip
+
+    >>> matrix, nodes = to_matrix(node1)
+    >>> copies = from_matrix(matrix)
+    >>>
+    >>> assert (to_matrix(copies[0])[0] != matrix).nnz == 0
+
+    Existing links are not duplicated
+
+    >>> nodes = from_matrix(matrix, nodes)
+    >>>
+    >>> assert node1.children == [node2, node3]
+    >>> assert node1.parents == [node3, ]
+
+    The amount of nodes has to match the matrix
+
+    >>> from_matrix(matrix, nodes[:2])
+    Traceback (most recent call last):
+    ...
+    ValueError: expected 3 nodes, got 2
+    """
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+
+    if nodes is None:
+        nodes = [node_class() for i in range(matrix.shape[0])]
+    elif len(nodes) != matrix.shape[0]:
+        raise ValueError('expected %d nodes, got %d' % (matrix.shape[0],
+            len(nodes)))
+
+    # links are written to the containers directly and the containers are
+    # notified once each instead of once per link
+    changed = dict()
+
+    for i, node in enumerate(nodes):
+        columns = matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]
+
+        if not len(columns):
+            continue
+
+        children = getattr(node, node._children_name)
+        existing = set(children)
+
+        for j in columns:
+            child = nodes[j]
+
+            if child not in existing:
+                existing.add(child)
+                children._nodes.append(child)
+
+                parents = getattr(child, child._parents_name)
+                parents._nodes.append(node)
+
+                changed[id(children)] = children
+                changed[id(parents)] = parents
+
+    for container in changed.values():
+        container._notify()
+
+    return nodes
+
+
+def bfs_levels(matrix, nodes, source):
+    """Finds the breadth-first levels of the nodes reachable from source by
+    following children. The source may be given as a node or as its index in
+    nodes. Passing the index avoids looking the node up. Any nonzero of the
+    matrix counts as a link regardless of its weight. The search runs within
+    SciPy in linear time. Returns a dictionary mapping nodes to their levels.
+
+    >>> node1, node2, node3, node4 = GraphNode(), GraphNode(), GraphNode(), \\
+    ...     GraphNode()
+    >>> node1.children = (node2, node3)
+    >>> node3.children = node4
+    >>> node4.children = node1
+    >>>
+    >>> matrix, nodes = to_matrix(node1)
+    >>> levels = bfs_levels(matrix, nodes, node3)
+    >>>
+    >>> assert levels == {node3: 0, node4: 1, node1: 2, node2: 3}
+    >>> assert bfs_levels(matrix, nodes, 2) == levels
+
+    Weighted links
+
+    >>> matrix = sparse.csr_matrix([[0, .5, -1], [0, 0, .3], [0, 0, 0]])
+    >>> nodes = from_matrix(matrix)
+    >>>
+    >>> assert bfs_levels(matrix, nodes, 0) == {nodes[0]: 0, nodes[1]: 1,
+    ...     nodes[2]: 1}
+    """
+    links = sparse.csr_matrix(matrix != 0, dtype=numpy.int8)
+    links.eliminate_zeros()
+
+    if not isinstance(source, numbers.Integral):
+        source = nodes.index(source)
+
+    distances = csgraph.shortest_path(links, method='D', directed=True,
+        unweighted=True, indices=source)
+
+    return dict((nodes[i], int(distances[i]))
+        for i in numpy.flatnonzero(numpy.isfinite(distances)))
+
+
+def pagerank(matrix, nodes, damping=0.85, tolerance=1e-6,
+        max_iterations=100):
+    """Computes PageRank of the nodes using power iteration. Nonzeros of the
+    matrix act as link weights. Rank of nodes without children is spread
+    evenly. Returns a dictionary mapping nodes to their ranks.
+
+    >>> node1, node2, node3 = GraphNode(), GraphNode(), GraphNode()
+    >>> node1.children = (node2, node3)
+    >>> node2.children = node3
+    >>> node3.children = node1
+    >>>
+    >>> matrix, nodes = to_matrix(node1)
+    >>> ranks = pagerank(matrix, nodes)
+    >>>
+    >>> assert abs(sum(ranks.values()) - 1) < 1e-6
+    >>> assert ranks[node3] > ranks[node1] > ranks[node2]
+    """
+    count = matrix.shape[0]
+    matrix = sparse.csr_matrix(matrix, dtype=numpy.float64)
+
+    out_weights = numpy.asarray(matrix.sum(axis=1)).ravel()
+    dangling = out_weights == 0
+    inverse_weights = numpy.zeros(count)
+    inverse_weights[~dangling] = 1.0 / out_weights[~dangling]
+    transition = sparse.diags(inverse_weights).dot(matrix).T.tocsr()
+
+    ranks = numpy.empty(count)
+    ranks.fill(1.0 / count)
+
+    for i in range(max_iterations):
+        previous = ranks
+        ranks = damping * (transition.dot(previous) +
+            previous[dangling].sum() / count) + (1 - damping) / count
+
+        if numpy.abs(ranks - previous).sum() < tolerance:
+            break
+
+    return dict(zip(nodes, ranks.tolist()))
+
+
+def connected_components(matrix, nodes, strong=False):
+    """Labels the nodes by their connected component. Links are considered
+    undirected unless strong is set, in which case strongly connected
+    components are labeled. Returns a dictionary mapping nodes to labels.
+
+    >>> node1, node2, node3, node4 = GraphNode(), GraphNode(), GraphNode(), \\
+    ...     GraphNode()
+    >>> node1.children = node2
+    >>> node2.children = node3
+    >>> node3.children = node2
+    >>>
+    >>> matrix, nodes = to_matrix(node1, node4)
+    >>> labels = connected_components(matrix, nodes)
+    >>>
+    >>> assert labels[node1] == labels[node2] == labels[node3]
+    >>> assert labels[node4] != labels[node1]
+    >>>
+    >>> labels = connected_components(matrix, nodes, strong=True)
+    >>>
+    >>> assert labels[node2] == labels[node3]
+    >>> assert labels[node1] != labels[node2]
+    """
+    connection = 'strong' if strong else 'weak'
+    labels = csgraph.connected_components(matrix, directed=True,
+        connection=connection)[1]
+
+    return dict(zip(nodes, labels.tolist()))
+
+
+def degree_histograms(matrix):
+    """Counts the nodes per amount of parents and children. Returns in-degree
+    and out-degree histograms as arrays where the value at index i tells the
+    amount of nodes having degree i.
+
+    >>> node1, node2, node3 = GraphNode(), GraphNode(), GraphNode()
+    >>> node1.children = (node2, node3)
+    >>> node2.children = node3
+    >>>
+    >>> in_degrees, out_degrees = degree_histograms(to_matrix(node1)[0])
+    >>>
+    >>> assert in_degrees.tolist() == [1, 1, 1]
+    >>> assert out_degrees.tolist() == [1, 1, 1]
+    """
+    links = sparse.csr_matrix(matrix != 0, dtype=numpy.int64)
+    in_degrees = numpy.asarray(links.sum(axis=0)).ravel()
+    out_degrees = numpy.asarray(links.sum(axis=1)).ravel()
+
+    return numpy.bincount(in_degrees), numpy.bincount(out_degrees)
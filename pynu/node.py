@@ -25,7 +25,30 @@ LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import copy
 import re
+import weakref
+
+# marks the deep copies made by Node.clone
+_CLONING = object()
+
+
+def _all_match(node, search_clauses):
+    """Checks if the attributes of the node match all given clauses. String
+    clauses are matched as regular expressions. Raises AttributeError in case
+    the node lacks an attribute."""
+    for wanted_attribute, wanted_value in search_clauses.items():
+        attribute_value = getattr(node, wanted_attribute)
+
+        if isinstance(wanted_value, str):
+            matched = re.match(wanted_value, attribute_value)
+        else:
+            matched = wanted_value == attribute_value
+
+        if not matched:
+            return False
+
+    return True
 
 
 class NodeContainer(object):
@@ -41,6 +64,12 @@ class NodeContainer(object):
     def __getitem__(self, key):
         return self._nodes[key]
 
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __contains__(self, item):
+        return item in self._nodes
+
     def __eq__(self, other):
         """Checks if container contents are equal to other.
 
@@ -107,12 +136,24 @@ class NodeContainer(object):
         >>>
         >>> assert len(node1.children) == 0
         >>> assert len(node2.parents) == 0
+
+        Empty multiple
+
+        >>> node1, node2, node3 = Node(), Node(), Node()
+        >>>
+        >>> node1.children = (node2, node3)
+        >>> node1.children.empty()
+        >>>
+        >>> assert len(node1.children) == 0
+        >>> assert len(node2.parents) == 0
+        >>> assert len(node3.parents) == 0
         """
-        for item in self._nodes:
+        for item in list(self._nodes):
             self._nodes.remove(item)
             complementary_items = getattr(item,
                 self.complementary_name)
             complementary_items.remove(self.owner)
+            self._notify()
 
     def append(self, *items):
         """Appends given items to container.
@@ -160,6 +201,7 @@ class NodeContainer(object):
                 complementary_items = getattr(item,
                     self.complementary_name)
                 complementary_items.append(self.owner)
+                self._notify()
 
     def remove(self, *items):
         """Removes given items from container.
@@ -201,6 +243,7 @@ class NodeContainer(object):
                 complementary_items = getattr(item,
                     self.complementary_name)
                 complementary_items.remove(self.owner)
+                self._notify()
 
     def find(self, **kvargs):
         """Finds nodes matching to given rules. The idea is that the method
@@ -266,6 +309,24 @@ class NodeContainer(object):
         if len(found_nodes) > 0:
             return found_nodes[0] if len(found_nodes) == 1 else found_nodes
 
+    def _notify(self):
+        """Invalidates observers (ie. indexes) of the owner. Observers are
+        kept as weak references and the ones of collected observers are
+        dropped. Both ends of a link are notified as the complementary
+        container is updated too."""
+        observers = getattr(self.owner, '_observers', None)
+
+        if not observers:
+            return
+
+        observers[:] = [ref for ref in observers if ref() is not None]
+
+        for observer_ref in list(observers):
+            observer = observer_ref()
+
+            if observer is not None:
+                observer.invalidate()
+
     def _recursion(self, search_clauses, found_nodes, visited_nodes):
         visited_nodes.append(self.owner)
 
@@ -285,18 +346,172 @@ class NodeContainer(object):
         return found_nodes
 
     def _all_match(self, node, search_clauses):
-        for wanted_attribute, wanted_value in search_clauses.items():
-            attribute_value = getattr(node, wanted_attribute)
+        return _all_match(node, search_clauses)
 
-            if isinstance(wanted_value, str):
-                matched = re.match(wanted_value, attribute_value)
-            else:
-                matched = wanted_value == attribute_value
 
-            if not matched:
-                return False
+class _WeakNodeList(object):
+    """List-like storage that refers to its nodes weakly. Nodes that get
+    garbage collected are dropped from the list automatically."""
+
+    def __init__(self):
+        super(_WeakNodeList, self).__init__()
+
+        self._refs = list()
+        self_ref = weakref.ref(self)
+
+        def discard(ref):
+            node_list = self_ref()
+
+            if node_list is not None:
+                node_list._refs[:] = [r for r in node_list._refs
+                    if r is not ref]
+
+        self._discard = discard
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [ref() for ref in self._refs[key]]
+
+        return self._refs[key]()
+
+    def __iter__(self):
+        return iter([ref() for ref in self._refs])
+
+    def __contains__(self, item):
+        return any(ref() is item for ref in self._refs)
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __copy__(self):
+        node_list = _WeakNodeList()
+        node_list.extend(self)
+
+        return node_list
+
+    def __deepcopy__(self, memo):
+        # the references are created anew so that they refer to the copies
+        # and discard from the copied list
+        node_list = _WeakNodeList()
+        memo[id(self)] = node_list
+        node_list.extend(copy.deepcopy(list(self), memo))
+
+        return node_list
+
+    def append(self, item):
+        self._refs.append(weakref.ref(item, self._discard))
+
+    def extend(self, items):
+        self._refs.extend(weakref.ref(item, self._discard) for item in items)
+
+    def remove(self, item):
+        for i, ref in enumerate(self._refs):
+            if ref() is item:
+                del self._refs[i]
+
+                return
+
+        raise ValueError('%r not in list' % (item, ))
+
+
+class WeakOwnerContainer(NodeContainer):
+    """Container that refers to its owner weakly. Use this for the children
+    side of nodes that should not form reference cycles with their own
+    containers.
+
+    >>> class Owner(object):
+    ...     pass
+    >>>
+    >>> owner = Owner()
+    >>> container = WeakOwnerContainer(owner, 'children', 'parents')
+    >>>
+    >>> assert container.owner is owner
+    >>>
+    >>> del owner
+    >>> assert container.owner is None
+    """
+
+    def _get_owner(self):
+        return self._owner()
 
-        return True
+    def _set_owner(self, owner):
+        self._owner = weakref.ref(owner)
+
+    owner = property(_get_owner, _set_owner)
+
+    def __deepcopy__(self, memo):
+        """Deep copies the container so that the copy refers to the copy of
+        the owner.
+
+        >>> import copy
+        >>>
+        >>> class WeakNode(Node):
+        ...     _children_container = WeakOwnerContainer
+        ...     _parents_container = WeakNodeContainer
+        >>>
+        >>> node1, node2 = WeakNode(), WeakNode()
+        >>> node1.children = node2
+        >>>
+        >>> copy1 = copy.deepcopy(node1)
+        >>> copy2 = copy1.children[0]
+        >>>
+        >>> assert copy1.children.owner is copy1
+        >>> assert copy2 is not node2
+        >>> assert copy2.parents == [copy1, ]
+        >>>
+        >>> copy1.children.empty()
+        >>>
+        >>> assert copy2.parents == None
+        >>> assert node1.children == [node2, ]
+        >>> assert node2.parents == [node1, ]
+        """
+        container = type(self).__new__(type(self))
+        memo[id(self)] = container
+
+        for name, value in self.__dict__.items():
+            if name != '_owner':
+                container.__dict__[name] = copy.deepcopy(value, memo)
+
+        owner = self.owner
+        if owner is None:
+            container._owner = self._owner
+        else:
+            container.owner = copy.deepcopy(owner, memo)
+
+        return container
+
+
+class WeakNodeContainer(WeakOwnerContainer):
+    """Container that refers to both its owner and its items weakly. Use this
+    for the parents side so that a node does not keep its parents alive.
+    Combined with WeakOwnerContainer on the children side there are no
+    reference cycles between a parent and its children and dropped subtrees
+    are freed by reference counting instead of the cyclic garbage collector.
+
+    >>> class WeakNode(Node):
+    ...     _children_container = WeakOwnerContainer
+    ...     _parents_container = WeakNodeContainer
+    >>>
+    >>> node1, node2 = WeakNode(), WeakNode()
+    >>> node1.children = node2
+    >>>
+    >>> assert node2.parents == [node1, ]
+    >>>
+    >>> del node1
+    >>> assert node2.parents == None
+    """
+
+    def __init__(self, owner, name, complementary_name):
+        super(WeakNodeContainer, self).__init__(owner, name,
+            complementary_name)
+
+        self._nodes = _WeakNodeList()
 
 
 class Node(object):
@@ -356,3 +571,141 @@ class Node(object):
             container_template(name)
         else:
             super(Node, self).__setattr__(name, value)
+
+    def detach(self):
+        """Detaches the node from its parents. Only the links of the node
+        itself are touched so the cost depends on the amount of its parents,
+        not on the size of the subtree below it. In a tree this cuts the whole
+        subtree off. In a graph the descendants of the node keep their links
+        to any other parents they have.
+
+        >>> node1, node2, node3 = Node(), Node(), Node()
+        >>> node1.children = node2
+        >>> node2.children = node3
+        >>>
+        >>> assert node2.detach() is node2
+        >>>
+        >>> assert node1.children == None
+        >>> assert node2.parents == None
+        >>> assert node2.children == [node3, ]
+
+        Other parents of descendants are kept
+
+        >>> node4 = Node()
+        >>> node4.children = node3
+        >>> node2.detach()  # doctest: +ELLIPSIS
+        <...Node object at ...>
+        >>>
+        >>> assert node3.parents == [node2, node4]
+        """
+        getattr(self, self._parents_name).empty()
+
+        return self
+
+    def __deepcopy__(self, memo):
+        """Deep copies the node. Nodes that are not being cloned are shared
+        while Node.clone copies attributes."""
+        if id(_CLONING) in memo:
+            return self
+
+        node = type(self).__new__(type(self))
+        memo[id(self)] = node
+        node.__dict__.update(copy.deepcopy(self.__dict__, memo))
+
+        return node
+
+    def clone(self, attributes='shallow'):
+        """Clones the node and its descendants, ie. the nodes reachable from
+        it through children. Parents of the node and other nodes linked only
+        through parents are not cloned, so for a graph node this clones the
+        part of the graph below it. Links to nodes outside of the cloned ones
+        are left out. The nodes are copied iteratively so deep structures do
+        not hit the recursion limit.
+
+        The clones are created by calling their class without arguments so
+        __init__ sets up their private state. Only public attributes are
+        copied. In case attributes is 'shallow', the values are shared with
+        the original nodes. In case it is 'deep', the values are deep copied,
+        references to cloned nodes within them point to the clones and
+        references to other nodes are kept as they are.
+
+        Cloning large structures allocates many objects that the cyclic
+        garbage collector scans repeatedly. Pausing it (gc.disable) around
+        the call may halve the time taken.
+
+        >>> node1, node2, node3 = Node(), Node(), Node()
+        >>> node1.children = node2
+        >>> node2.children = node3
+        >>> node3.children = node2
+        >>> node2.items = [node3, ]
+        >>>
+        >>> clone = node2.clone()
+        >>> clone3 = clone.children[0]
+        >>>
+        >>> assert clone is not node2 and clone3 is not node3
+        >>> assert clone.parents == [clone3, ]
+        >>> assert clone3.children == [clone, ]
+        >>> assert clone.items is node2.items
+
+        Deep copy of attributes
+
+        >>> node2.outside = [node1, ]
+        >>> clone = node2.clone(attributes='deep')
+        >>>
+        >>> assert clone.items is not node2.items
+        >>> assert clone.items == [clone.children[0], ]
+        >>> assert clone.outside is not node2.outside
+        >>> assert clone.outside[0] is node1
+
+        Private state is set up by __init__
+
+        >>> class CachingNode(Node):
+        ...     def __init__(self):
+        ...         super(CachingNode, self).__init__()
+        ...         self._cache = dict()
+        >>>
+        >>> node = CachingNode()
+        >>> node._cache['key'] = 'value'
+        >>>
+        >>> assert node.clone()._cache == {}
+        """
+        if attributes not in ('shallow', 'deep'):
+            raise ValueError("attributes should be 'shallow' or 'deep'")
+
+        clones = {self: type(self)()}
+        pending = [self]
+
+        while pending:
+            node = pending.pop()
+
+            for child in node.__dict__[node._children_name]._nodes:
+                if child not in clones:
+                    clones[child] = type(child)()
+                    pending.append(child)
+
+        if attributes == 'deep':
+            memo = dict((id(node), clone) for node, clone in clones.items())
+            memo[id(_CLONING)] = _CLONING
+
+        for node, clone in clones.items():
+            children_name, parents_name = node._children_name, \
+                node._parents_name
+            values = dict((name, value)
+                for name, value in node.__dict__.items()
+                if not name.startswith('_') and
+                name not in (children_name, parents_name))
+
+            if attributes == 'deep':
+                values = copy.deepcopy(values, memo)
+
+            clone.__dict__.update(values)
+
+            # both directions are copied from the original so the order of
+            # the links is preserved
+            clone.__dict__[children_name]._nodes.extend([clones[child]
+                for child in node.__dict__[children_name]._nodes])
+            clone.__dict__[parents_name]._nodes.extend([clones[parent]
+                for parent in node.__dict__[parents_name]._nodes
+                if parent in clones])
+
+        return clones[self]
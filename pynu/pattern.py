@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Pattern matching utilities.
+"""
+"""
+Pynu - Python Node Utilities
+Copyright (c) 2014 Juho Vepsäläinen
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import collections
+
+from graph import GraphNode, _connected_nodes
+from node import Node, _all_match
+
+
+class Pattern(object):
+    """Describes a structure to look for in a graph. A pattern consists of
+    named nodes having attribute clauses and links between them. Clauses work
+    the same way as in find. Each pattern node is matched by a distinct graph
+    node.
+
+    Matching starts from the pattern node estimated to have the fewest
+    candidates. The estimates are based on a sample of the graph. The rest of
+    the pattern nodes are matched by following the links from the nodes
+    matched already, so only the neighbours of partial matches get visited.
+
+    >>> service, db, other = GraphNode(), GraphNode(), GraphNode()
+    >>> owner = GraphNode()
+    >>>
+    >>> service.kind, db.kind, other.kind = 'service', 'db', 'queue'
+    >>> owner.team = 'X'
+    >>> owner.children = service
+    >>> service.children = (db, other)
+    >>>
+    >>> pattern = Pattern().node('service', kind='service')
+    >>> pattern = pattern.node('db', kind='db').node('owner', team='X')
+    >>> pattern = pattern.link('service', 'db').link('owner', 'service')
+    >>>
+    >>> assert pattern.match(db) == [
+    ...     {'service': service, 'db': db, 'owner': owner}]
+
+    No match
+
+    >>> owner.team = 'Y'
+    >>>
+    >>> assert pattern.match(db) == []
+
+    Multiple matches
+
+    >>> pattern = Pattern().node('parent').node('child', kind='^.')
+    >>> pattern = pattern.link('parent', 'child')
+    >>> matches = pattern.match(owner)
+    >>>
+    >>> assert len(matches) == 3
+    >>> assert {'parent': service, 'child': other} in matches
+
+    Cyclic case
+
+    >>> node1, node2 = GraphNode(), GraphNode()
+    >>> node1.children = node2
+    >>> node2.children = node1
+    >>>
+    >>> pattern = Pattern().link('a', 'b').link('b', 'a')
+    >>>
+    >>> assert len(pattern.match(node1)) == 2
+    >>>
+    >>> pattern = Pattern().link('a', 'a')
+    >>>
+    >>> assert pattern.match(node1) == []
+    >>>
+    >>> node1.children.append(node1)
+    >>> assert pattern.match(node1) == [{'a': node1}]
+    """
+    _sample_size = 64
+
+    def __init__(self):
+        super(Pattern, self).__init__()
+
+        self._clauses = collections.OrderedDict()
+        self._links = list()
+
+    def node(self, name, **clauses):
+        """Adds a node with the given attribute clauses to the pattern. Returns
+        the pattern."""
+        self._clauses[name] = clauses
+
+        return self
+
+    def link(self, parent, child):
+        """Requires child to be one of the children of parent. Nodes not added
+        to the pattern yet are added without clauses. Returns the pattern."""
+        for name in (parent, child):
+            self._clauses.setdefault(name, dict())
+
+        self._links.append((parent, child))
+
+        return self
+
+    def match(self, *nodes, **bound):
+        """Finds the matches of the pattern within the graphs the given nodes
+        belong to. Returns a list of dictionaries mapping pattern node names
+        to the matched nodes.
+
+        Pattern nodes may be bound by name to a node or to a collection of
+        candidate nodes. Bound pattern nodes are matched first and only among
+        their candidates. In case every part of the pattern is linked to a
+        bound node, the graph is not traversed as a whole and the nodes to
+        search may be left out.
+
+        >>> node1, node2, node3 = GraphNode(), GraphNode(), GraphNode()
+        >>> node1.children = (node2, node3)
+        >>> node2.kind, node3.kind = 'db', 'db'
+        >>>
+        >>> pattern = Pattern().node('child', kind='db')
+        >>> pattern = pattern.link('parent', 'child')
+        >>>
+        >>> assert pattern.match(child=node2) == [
+        ...     {'parent': node1, 'child': node2}]
+        >>> assert len(pattern.match(parent=[node1, node2])) == 2
+        >>> assert pattern.match(child=node1) == []
+        """
+        for name in bound:
+            if name not in self._clauses:
+                raise ValueError('unknown pattern node %r' % (name, ))
+
+        candidates = dict((name, [value] if isinstance(value, Node) else
+            list(value)) for name, value in bound.items())
+
+        if self._needs_universe(candidates):
+            roots = list(nodes)
+            for name_candidates in candidates.values():
+                roots.extend(name_candidates)
+
+            universe = _connected_nodes(roots)
+        else:
+            universe = None
+
+        matches = list()
+        self._extend(self._plan(universe, candidates), dict(), set(),
+            universe, matches)
+
+        return matches
+
+    def _needs_universe(self, candidates):
+        """Checks if some part of the pattern lacks bound pattern nodes."""
+        reached = set(candidates)
+        pending = list(reached)
+
+        while pending:
+            name = pending.pop()
+
+            for parent, child in self._links:
+                for linked, other in ((parent, child), (child, parent)):
+                    if linked == name and other not in reached:
+                        reached.add(other)
+                        pending.append(other)
+
+        return len(reached) < len(self._clauses)
+
+    def _estimate(self, clauses, universe):
+        if not clauses:
+            return 1.0
+
+        if universe is None:
+            # the more clauses the more selective without a graph to sample
+            return 1.0 / (1 + len(clauses))
+
+        if not universe:
+            return 1.0
+
+        sample = universe[::max(1, len(universe) // self._sample_size)]
+
+        return sum(1 for node in sample if _matches(node, clauses)) / \
+            float(len(sample))
+
+    def _plan(self, universe, candidates):
+        """Orders the pattern nodes so that the bound ones come first and each
+        one after them is linked to the ones before it whenever possible,
+        preferring the most selective ones. Each step lists the links to
+        check against the nodes matched already."""
+        estimates = dict((name, self._estimate(clauses, universe))
+            for name, clauses in self._clauses.items())
+        for name, name_candidates in candidates.items():
+            estimates[name] = -1.0 / (1 + len(name_candidates))
+
+        remaining = list(self._clauses)
+        bound = set()
+        plan = list()
+
+        while remaining:
+            linked = [name for name in remaining
+                if any(parent in bound and child == name or
+                    child in bound and parent == name
+                    for parent, child in self._links)]
+            anchored = [name for name in remaining if name in candidates]
+            name = min(anchored or linked or remaining, key=estimates.get)
+
+            # (other, direction) pairs: candidates have to be among the
+            # direction ('children' or 'parents') of the other match. Links
+            # to the node itself go last as they cannot provide candidates.
+            anchors = list()
+            for parent, child in self._links:
+                if child == name and parent in bound:
+                    anchors.append((parent, 'children'))
+                elif parent == name and child in bound:
+                    anchors.append((child, 'parents'))
+
+            if (name, name) in self._links:
+                anchors.append((name, 'children'))
+
+            remaining.remove(name)
+            bound.add(name)
+
+            plan.append((name, self._clauses[name], anchors,
+                candidates.get(name)))
+
+        return plan
+
+    def _extend(self, plan, binding, used, universe, matches):
+        if len(binding) == len(plan):
+            matches.append(dict(binding))
+
+            return
+
+        name, clauses, anchors, candidates = plan[len(binding)]
+
+        if candidates is None:
+            if anchors and anchors[0][0] != name:
+                candidates = _neighbours(binding[anchors[0][0]],
+                    anchors[0][1])
+                anchors = anchors[1:]
+            else:
+                candidates = universe
+
+        for candidate in list(candidates):
+            if candidate in used or not _matches(candidate, clauses):
+                continue
+
+            binding[name] = candidate
+
+            if all(candidate in _neighbours(binding[other], direction)
+                    for other, direction in anchors):
+                used.add(candidate)
+                self._extend(plan, binding, used, universe, matches)
+                used.discard(candidate)
+
+            del binding[name]
+
+
+def _neighbours(node, direction):
+    if direction == 'children':
+        return getattr(node, node._children_name)
+
+    return getattr(node, node._parents_name)
+
+
+def _matches(node, clauses):
+    try:
+        return _all_match(node, clauses)
+    except AttributeError:
+        return False
@@ -25,7 +25,57 @@ LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from node import Node, NodeContainer
+import hashlib
+
+from node import Node, NodeContainer, WeakNodeContainer, WeakOwnerContainer
+
+try:
+    _PRIMITIVE_TYPES = (type(None), bool, int, long, float, str, unicode, )
+except NameError:
+    _PRIMITIVE_TYPES = (type(None), bool, int, float, str, bytes, )
+
+
+def _canonical(value):
+    """Returns a representation of the value built of tuples and primitive
+    values only. Its repr does not depend on object identities or on the
+    order of dictionaries and sets. Nodes are represented by a placeholder
+    and other objects by their repr in case their type defines one. Raises
+    TypeError for the rest."""
+    value_type = type(value)
+
+    if value_type in _PRIMITIVE_TYPES:
+        return (value_type.__name__, value)
+
+    if value_type in (list, tuple):
+        return (value_type.__name__, tuple(_canonical(item) for item in value))
+
+    if value_type in (set, frozenset):
+        return ('set', tuple(sorted(repr(_canonical(item)) for item in value)))
+
+    if value_type is dict:
+        return ('dict', tuple(sorted(
+            (repr(_canonical(key)), repr(_canonical(item)))
+            for key, item in value.items())))
+
+    if isinstance(value, Node):
+        return ('node', )
+
+    if value_type.__repr__ is not object.__repr__:
+        return ('repr', value_type.__name__, repr(value))
+
+    raise TypeError('%s values cannot be hashed, override '
+        '_structural_value to support them' % (value_type.__name__, ))
+
+
+class ChildContainer(NodeContainer):
+
+    def _notify(self):
+        """Invalidates the structural hashes of the owner and its ancestors in
+        addition to the observers."""
+        super(ChildContainer, self)._notify()
+
+        if self.owner is not None:
+            self.owner._invalidate_structural_hash()
 
 
 class ParentContainer(NodeContainer):
@@ -53,10 +103,171 @@ class ParentContainer(NodeContainer):
         self.append(content)
 
 
+class WeakChildContainer(WeakOwnerContainer, ChildContainer):
+    pass
+
+
+class WeakParentContainer(WeakNodeContainer, ParentContainer):
+    pass
+
+
 class TreeNode(Node):
+    _children_container = ChildContainer
     _parents_container = ParentContainer
     _parents_name = 'parent'
 
+    def __setattr__(self, name, value):
+        """Setting a public attribute invalidates the structural hashes of the
+        node and its ancestors.
+
+        >>> node1, node2 = TreeNode(), TreeNode()
+        >>> node1.children = node2
+        >>> node2.value = 13
+        >>>
+        >>> old_hash = node1.structural_hash()
+        >>> node2.value = 14
+        >>>
+        >>> assert node1.structural_hash() != old_hash
+        >>>
+        >>> node2.value = 13
+        >>> assert node1.structural_hash() == old_hash
+        """
+        super(TreeNode, self).__setattr__(name, value)
+
+        if not name.startswith('_') and \
+                name not in (self._children_name, self._parents_name):
+            self._invalidate_structural_hash()
+
+    def __delattr__(self, name):
+        super(TreeNode, self).__delattr__(name)
+
+        if not name.startswith('_'):
+            self._invalidate_structural_hash()
+
+    def _invalidate_structural_hash(self):
+        # a cached hash implies cached hashes below, so the walk can stop at
+        # the first node that has nothing cached
+        node = self
+
+        while node is not None and \
+                getattr(node, '_structural_hash', None) is not None:
+            node._structural_hash = None
+            parent = getattr(node, node._parents_name)
+            node = parent[0] if len(parent) else None
+
+    def _structural_value(self, name, value):
+        """Returns the representation of an attribute value used for hashing
+        or None to leave the attribute out. Override to support values that
+        lack a meaningful repr."""
+        if isinstance(value, Node):
+            return None
+
+        return _canonical(value)
+
+    def _attribute_digest(self):
+        attributes = list()
+
+        for name, value in vars(self).items():
+            if name.startswith('_') or \
+                    name in (self._children_name, self._parents_name):
+                continue
+
+            structural_value = self._structural_value(name, value)
+
+            if structural_value is not None:
+                attributes.append((name, repr(structural_value)))
+
+        attributes.sort()
+
+        return hashlib.sha1(repr(attributes).encode('utf-8')).hexdigest()
+
+    def structural_hash(self):
+        """Returns a hash of the subtree beginning from the current node. The
+        hash covers the order of the children and the public attributes of the
+        nodes. Primitive values (None, booleans, numbers and strings) and
+        lists, tuples, sets and dictionaries are hashed by content. Other
+        objects are hashed by their repr in case their type defines one.
+        Attributes referring to nodes are left out. Other values raise
+        TypeError unless _structural_value is overridden to handle them.
+
+        Hashes are cached and invalidated along the path to the root when an
+        attribute is set or deleted or when the children change. Changes made
+        in place to attribute values (ie. node.items.append(item)) go
+        unnoticed. Reassign the attribute after such a change.
+
+        >>> node1, node2, node3 = TreeNode(), TreeNode(), TreeNode()
+        >>> node1.children = node2
+        >>> node3.children = TreeNode()
+        >>>
+        >>> assert node1.structural_hash() == node3.structural_hash()
+        >>>
+        >>> node2.children = TreeNode()
+        >>> assert node1.structural_hash() != node3.structural_hash()
+
+        Dictionaries are compared by content and nodes are left out
+
+        >>> node1, node2 = TreeNode(), TreeNode()
+        >>> node1.values = dict((i, str(i)) for i in range(10))
+        >>> node2.values = dict((i, str(i)) for i in reversed(range(10)))
+        >>> node1.link, node2.link = node2, node1
+        >>>
+        >>> assert node1.structural_hash() == node2.structural_hash()
+
+        Changes in place have to be followed by reassignment
+
+        >>> node1.items = [1, ]
+        >>> old_hash = node1.structural_hash()
+        >>>
+        >>> node1.items.append(2)
+        >>> assert node1.structural_hash() == old_hash
+        >>>
+        >>> node1.items = node1.items
+        >>> assert node1.structural_hash() != old_hash
+
+        Objects having their own repr
+
+        >>> from decimal import Decimal
+        >>>
+        >>> node1, node2 = TreeNode(), TreeNode()
+        >>> node1.price, node2.price = Decimal('1.10'), Decimal('1.10')
+        >>> assert node1.structural_hash() == node2.structural_hash()
+        >>>
+        >>> node2.price = Decimal('1.20')
+        >>> assert node1.structural_hash() != node2.structural_hash()
+        >>> assert diff(node1, node2) == [(node1, node2)]
+
+        Objects lacking one
+
+        >>> class Payload(object):
+        ...     pass
+        >>>
+        >>> node1.payload = Payload()
+        >>> node1.structural_hash()  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        TypeError: Payload values cannot be hashed, ...
+        """
+        pending = [(self, False)]
+
+        while pending:
+            node, children_hashed = pending.pop()
+
+            if getattr(node, '_structural_hash', None) is not None:
+                continue
+
+            if children_hashed:
+                digest = hashlib.sha1(node._attribute_digest().encode('ascii'))
+
+                for child in node.children:
+                    digest.update(child._structural_hash.encode('ascii'))
+
+                node._structural_hash = digest.hexdigest()
+            else:
+                pending.append((node, True))
+                pending.extend((child, False) for child in node.children)
+
+        return self._structural_hash
+
     def find_root(self):
         """Finds the root node.
 
@@ -102,3 +313,127 @@ class TreeNode(Node):
 
         for child_walk_node in _walk(self.children):
             yield child_walk_node
+
+
+class WeakTreeNode(TreeNode):
+    """TreeNode that refers to its parent weakly. A subtree that is not
+    referenced anywhere else is freed as soon as it is detached from its
+    parent without waiting for the cyclic garbage collector. Note that the
+    root has to be kept referenced explicitly.
+
+    >>> import gc
+    >>> import weakref
+    >>>
+    >>> root, child = WeakTreeNode(), WeakTreeNode()
+    >>> grandchild = WeakTreeNode()
+    >>> root.children = child
+    >>> child.children = grandchild
+    >>>
+    >>> assert grandchild.find_root() == root
+    >>>
+    >>> grandchild_ref = weakref.ref(grandchild)
+    >>>
+    >>> gc.disable()
+    >>> try:
+    ...     subtree = child.detach()
+    ...     assert root.children == None
+    ...     del child, grandchild, subtree
+    ...     assert grandchild_ref() is None
+    ... finally:
+    ...     gc.enable()
+    """
+    _children_container = WeakChildContainer
+    _parents_container = WeakParentContainer
+
+
+def diff(tree_a, tree_b):
+    """Finds differences between two trees. Subtrees having equal structural
+    hashes are skipped without visiting them so the cost depends on the size
+    of the change rather than the size of the trees. Children are paired by
+    hash first and the rest by position.
+
+    Returns a list of (node_a, node_b) pairs. In case both are given the
+    attributes of the nodes or the order of their children differ. Otherwise
+    the subtree exists only in one of the trees.
+
+    >>> def build(*colors):
+    ...     root = TreeNode()
+    ...     root.children = [TreeNode() for color in colors]
+    ...     for child, color in zip(root.children, colors):
+    ...         child.color = color
+    ...     return root
+    >>>
+    >>> tree_a = build('red', 'green', 'blue')
+    >>> tree_b = build('red', 'green', 'blue')
+    >>>
+    >>> assert diff(tree_a, tree_b) == []
+
+    Changed node
+
+    >>> tree_b.children[1].color = 'black'
+    >>>
+    >>> assert diff(tree_a, tree_b) == [(tree_a.children[1],
+    ...     tree_b.children[1])]
+
+    Added and removed nodes
+
+    >>> tree_a = build('red', 'green')
+    >>> tree_b = build('green', 'blue', 'black')
+    >>> changes = diff(tree_a, tree_b)
+    >>>
+    >>> assert (tree_a.children[0], tree_b.children[1]) in changes
+    >>> assert (None, tree_b.children[2]) in changes
+    >>> assert len(changes) == 2
+
+    Reordered children
+
+    >>> tree_a = build('red', 'green')
+    >>> tree_b = build('green', 'red')
+    >>>
+    >>> assert diff(tree_a, tree_b) == [(tree_a, tree_b)]
+    """
+    changes = list()
+    pending = [(tree_a, tree_b)]
+
+    while pending:
+        node_a, node_b = pending.pop()
+
+        if node_a is None or node_b is None:
+            changes.append((node_a, node_b))
+            continue
+
+        if node_a.structural_hash() == node_b.structural_hash():
+            continue
+
+        children_b = dict()
+        for child_b in node_b.children:
+            children_b.setdefault(child_b.structural_hash(), []).append(
+                child_b)
+
+        matched = list()
+        unmatched_a = list()
+        for child_a in node_a.children:
+            candidates = children_b.get(child_a.structural_hash())
+
+            if candidates:
+                matched.append(candidates.pop(0))
+            else:
+                unmatched_a.append(child_a)
+
+        matched_b = set(matched)
+        unmatched_b = [child_b for child_b in node_b.children
+            if child_b not in matched_b]
+
+        matched_in_order = [child_b for child_b in node_b.children
+            if child_b in matched_b]
+        if node_a._attribute_digest() != node_b._attribute_digest() or \
+                matched != matched_in_order:
+            changes.append((node_a, node_b))
+
+        for i in range(max(len(unmatched_a), len(unmatched_b))):
+            pending.append((
+                unmatched_a[i] if i < len(unmatched_a) else None,
+                unmatched_b[i] if i < len(unmatched_b) else None,
+            ))
+
+    return changes
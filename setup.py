@@ -47,6 +47,9 @@ traversal and manipulation functionality.',
         'setuptools',
         # -*- Extra requirements: -*-
     ],
+    extras_require={
+        'matrix': ['numpy', 'scipy', ],
+    },
       classifiers=[
           'Development Status :: 3 - Alpha',
           'Intended Audience :: Developers',